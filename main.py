@@ -1,48 +1,188 @@
-import asyncio, tempfile, traceback, shutil
-from fastapi import FastAPI, UploadFile, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
-from reader import make_reader
+import asyncio, hashlib, os, tempfile, time, traceback, shutil, uuid
+import aiofiles, multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, UploadFile, HTTPException
+from fastapi.responses import StreamingResponse
+from reader import make_reader_io, make_reader_cpu, close_session, kanji_by_grade
+from reader.core import KANJI_JSON
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import BackgroundTasks
+from typing import Annotated
+from pydantic import (BaseModel, ConfigDict, Field, PositiveInt,
+                      StringConstraints, field_validator)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ruby injection + EPUB build are GIL-bound → give them their own processes.
+    # forkserver: the first submit comes from a _POOL thread, and forking a
+    # multi-threaded server can deadlock the child on inherited locks
+    app.state.pool = ProcessPoolExecutor(
+        max_workers=max(1, (os.cpu_count() or 2) - 1),
+        mp_context=multiprocessing.get_context("forkserver"))
+    yield
+    app.state.pool.shutdown(wait=True)
 
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Kanji Reader API",
     docs_url=None,               # hide Swagger in production
-    redoc_url=None
+    redoc_url=None,
+    # no custom response class: handlers declare return types and FastAPI
+    # (≥0.130) serializes them straight to JSON bytes via Pydantic
 )
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://kiwibookworld.com"],  # or ["*"] for quick test
-    allow_methods=["POST"],
+    allow_methods=["GET", "POST"],
     allow_headers=["Content-Type"],
+    allow_credentials=False,
+    max_age=86400,                # browsers cache the preflight for a day
 )
 
-from fastapi.responses import PlainTextResponse
-import inspect, pathlib
+from fastapi.responses import PlainTextResponse, Response
+import pathlib
+import reader as _reader
+
+# both answers are constant for the life of the process → build them once
+_ROOT_BODY = b'{"status":"ok"}'
+_ROOT_HEADERS = {"Cache-Control": "public, max-age=60"}
+_PENDING_BODY = b'{"status":"pending"}'
+# the MEXT grade lists only change with a deploy → cache for a day, then
+# revalidate by content hash (a changed list is picked up within that day)
+_KANJI_HEADERS = {
+    "Cache-Control": "public, max-age=86400",
+    "ETag": f'"{hashlib.md5(KANJI_JSON.read_bytes()).hexdigest()}"',
+}
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    "If-None-Match test: '*', comma-separated lists, weak (W/) tags."
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag
+               for tag in if_none_match.split(","))
+
+if os.getenv("KANJI_DEBUG") == "1":        # not registered in production
+    _DEBUG_BODY = (
+        f"path  : {pathlib.Path(_reader.__file__).resolve().parent}\n"
+        f"attrs : {[a for a in dir(_reader) if a.startswith('make')]}\n"
+    ).encode()
 
-@app.get("/debug/reader", include_in_schema=False)
-def debug_reader():
-    mod_path = pathlib.Path(sys.modules["reader"].__file__).resolve().parent
-    attrs = [a for a in dir(reader) if a.startswith("make")]
-    return PlainTextResponse(f"path  : {mod_path}\nattrs : {attrs}\n")
+    @app.get("/debug/reader", include_in_schema=False)
+    def debug_reader():
+        return PlainTextResponse(_DEBUG_BODY)
 
 
 @app.get("/", include_in_schema=False)
 def root():
-    return JSONResponse({"status": "ok"})
+    return Response(_ROOT_BODY, media_type="application/json",
+                    headers=_ROOT_HEADERS)
+
+@app.get("/kanji/{grade}")
+def kanji_grid(grade: int, request: Request, response: Response) -> list[str]:
+    kanji = kanji_by_grade().get(str(grade))
+    if kanji is None:
+        raise HTTPException(404, f"unknown grade {grade}")
+    if _etag_matches(request.headers.get("if-none-match"), _KANJI_HEADERS["ETag"]):
+        return Response(status_code=304, headers=_KANJI_HEADERS)
+    response.headers.update(_KANJI_HEADERS)
+    return kanji
+
+# ---------- background generation ----------
+# make_reader takes minutes (LLM + image calls); run it off the event loop
+# and let the client poll for the result instead of holding the request.
+_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="generate")
+_JOBS: dict[str, tuple[Future, str, float]] = {}   # job_id → (future, tmpdir, submitted)
+JOB_TTL = 60 * 60          # finished jobs nobody collected are dropped after 1 h
+
+def _pop_stale_jobs() -> list[str]:
+    "Forget finished jobs older than JOB_TTL; return their tmpdirs to delete."
+    cutoff = time.monotonic() - JOB_TTL
+    stale = [job_id for job_id, (fut, _, t0) in _JOBS.items()
+             if t0 < cutoff and fut.done()]
+    return [_JOBS.pop(job_id)[1] for job_id in stale]
+
+def _rmtree_all(dirs: list[str]):
+    for d in dirs:
+        shutil.rmtree(d, ignore_errors=True)
+
+async def _iter_file(path: pathlib.Path, chunk: int = 1 << 20):
+    "Read a file in 1 MB chunks without blocking the event loop."
+    async with aiofiles.open(path, "rb") as fp:
+        while (block := await fp.read(chunk)):
+            yield block
+
+async def _job(work: pathlib.Path, data: dict):
+    try:
+        draft = await make_reader_io(**data)
+    finally:
+        await close_session()      # the HTTP session dies with this loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(app.state.pool, make_reader_cpu, draft, work)
+
+def _run_job(tmpdir: str, data: dict):
+    return asyncio.run(_job(pathlib.Path(tmpdir), data))
+
+class JobCreated(BaseModel):
+    job_id: str
+
+_Kanji = Annotated[str, StringConstraints(min_length=1, max_length=1)]
+
+class GenerateReq(BaseModel):
+    """Body of POST /generate – mirrors make_reader_io's keyword arguments."""
+    model_config = ConfigDict(extra="forbid")
+
+    grade: int = Field(ge=1, le=6)              # same grades as /kanji/{grade}
+    kanji: list[_Kanji] = Field(min_length=1)
+    min_freq: int = Field(3, ge=1)
+    wc_range: tuple[PositiveInt, PositiveInt] = (2000, 3000)
+    n_pics: int = Field(0, ge=0)
+    style: str = "Colored Pencil sketch"
+    idea: str | None = None
+
+    @field_validator("wc_range")
+    @classmethod
+    def _wc_ordered(cls, v: tuple[int, int]) -> tuple[int, int]:
+        if v[0] > v[1]:
+            raise ValueError("wc_range must be (min, max) with min <= max")
+        return v
+
+@app.post("/generate", status_code=202)
+async def generate(req: GenerateReq, bk: BackgroundTasks) -> JobCreated:
+    # clients that never poll would otherwise leak their output forever
+    if (stale := _pop_stale_jobs()):
+        bk.add_task(_rmtree_all, stale)
+    tmpdir = tempfile.mkdtemp(prefix="kanjirdr-")
+    job_id = uuid.uuid4().hex
+    _JOBS[job_id] = (_POOL.submit(_run_job, tmpdir, req.model_dump()), tmpdir,
+                     time.monotonic())
+    return JobCreated(job_id=job_id)
 
-@app.post("/generate")
-async def generate(data: dict, bk: BackgroundTasks):
-    #tmp = tempfile.TemporaryDirectory() # auto-deleted on GC
-    tmpdir = tempfile.mkdtemp()
+@app.get("/generate/{job_id}")
+async def generate_result(job_id: str, bk: BackgroundTasks):
+    if job_id not in _JOBS:
+        raise HTTPException(404, "unknown job")
+    fut, tmpdir, _ = _JOBS[job_id]
+    if not fut.done():
+        return Response(_PENDING_BODY, status_code=202,
+                        media_type="application/json")
+    del _JOBS[job_id]
     try:
-        epub, html = await make_reader(out_dir=pathlib.Path(tmpdir), **data)
+        epub, html = fut.result()
     except Exception as exc:
-        traceback.print_exc() 
+        traceback.print_exception(exc)
+        shutil.rmtree(tmpdir, ignore_errors=True)   # failed jobs must not leak
         raise HTTPException(400, str(exc))
+    # removed only after the response has finished streaming
     bk.add_task(shutil.rmtree, tmpdir, ignore_errors=True)
     # single-file return (html); you may zip three files instead    
-    return FileResponse(html, media_type="text/html; charset=utf-8",
-                        filename=html.name)
+    return StreamingResponse(
+        _iter_file(html), media_type="text/html; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{html.name}"',
+                 "Content-Length": str(html.stat().st_size)}
+    )
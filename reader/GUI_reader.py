@@ -1,17 +1,9 @@
 # gui_reader.py
-import asyncio, json, threading, tkinter as tk
+import asyncio, threading, tkinter as tk
 from tkinter import ttk, messagebox
-from pathlib import Path
-from . import make_reader
+from . import make_reader, close_session, kanji_by_grade, CHAR2GRADE
 import webbrowser
 
-KANJI_FILE = Path(__file__).parent / "kanji_by_grade.json"
-
-# ── core async helper ───────────────────────────────────────────
-def run_async(coro):
-    """Run an asyncio coroutine in a background thread (keeps UI alive)."""
-    threading.Thread(target=lambda: asyncio.run(coro), daemon=True).start()
-
 # ── GUI ─────────────────────────────────────────────────────────
 class ReaderGUI(tk.Tk):
     def __init__(self):
@@ -22,6 +14,12 @@ class ReaderGUI(tk.Tk):
         
         self.title("Kanji Reader Generator")
 
+        # one long-lived event loop in a background thread (keeps UI alive
+        # and lets HTTP sessions be reused across Generate clicks)
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
         # ── 1. SCROLLABLE ROOT ────────────────────────────
         canvas = tk.Canvas(self, borderwidth=0, highlightthickness=0)
         vsb    = ttk.Scrollbar(self, orient="vertical",
@@ -45,8 +43,12 @@ class ReaderGUI(tk.Tk):
         # --- keep a reference for later widget creation ---
         self.form = form
 
-        # --- load canonical kanji list once --------------
-        self.kanji_dict = json.load(KANJI_FILE.open(encoding="utf-8"))
+        # kanji columns per row; kept in sync with the window width
+        self._cols_wrap = 10
+        self.bind("<Configure>", self._on_resize)
+
+        # --- canonical kanji list (cached in reader.core) -
+        self.kanji_dict = kanji_by_grade()
 
         # ── 2.  REST OF ORIGINAL WIDGET CREATION ──────────
         self.build_form_widgets()      # moved to its own method
@@ -75,7 +77,14 @@ class ReaderGUI(tk.Tk):
             .grid(row=1, column=0, columnspan=2, sticky="w")
         self.kanji_frame = ttk.Frame(parent)
         self.kanji_frame.grid(row=2, column=0, columnspan=4, sticky="w")
-        self.selected_kanji = set()
+        # one Text widget holds the whole grid; selection is a single tag
+        self.kanji_text = tk.Text(self.kanji_frame, font=("Noto Serif JP", 14),
+                                  wrap="none", cursor="hand2", borderwidth=0,
+                                  highlightthickness=0, bg=self.cget("bg"))
+        self.kanji_text.tag_configure("selected", foreground="red")
+        self.kanji_text.bind("<Button-1>", self.on_kanji_click)
+        self.kanji_text.pack(anchor="w")
+        self.selected_kanji: set[str] = set()   # kept across grade switches
         self.populate_kanji()  # initial fill
 
         # ── Min repetition ────────────────────────────────────
@@ -125,35 +134,63 @@ class ReaderGUI(tk.Tk):
       
 
 
+    # ----- async helpers ---------------------------------
+
+    def run_async(self, coro):
+        """Schedule a coroutine on the GUI's background event loop."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def on_close(self):
+        try:
+            self.run_async(close_session()).result(timeout=5)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self.destroy()
+
     # ----- dynamic UI helpers ----------------------------
 
+    def _on_resize(self, event):
+        if event.widget is not self:            # children bubble up here too
+            return
+        cell_w    = 28                          # ≈ glyph width + gap
+        cols_wrap = max(10, -1 + event.width // cell_w)   # never less than 10
+        if cols_wrap != self._cols_wrap:
+            self._cols_wrap = cols_wrap
+            self.populate_kanji()
+
     def populate_kanji(self):
-        for w in self.kanji_frame.winfo_children():
-            w.destroy()
-        self.selected_kanji.clear()
-        
-        self.update_idletasks()                 # be sure geometry is settled
-        win_w      = self.winfo_width()         # current window width in px
-        cell_w     = 28                         # ≈ label width + gap
-        cols_wrap  = max(10, -1 + win_w // cell_w)   # never less than 10
-    
-        grade = self.grade_var.get()
-        row = col = 0
-        for ch in self.kanji_dict.get(grade, []):
-            lbl = tk.Label(self.kanji_frame, text=ch, font=("Noto Serif JP", 14))
-            lbl.grid(row=row, column=col, padx=0, pady=0) 
-            lbl.bind("<Button-1>", lambda e, c=ch, l=lbl: self.toggle_kanji(c, l))
-            col += 1
-            if col % cols_wrap == 0:  # wrap
-                row += 1; col = 0
-
-    def toggle_kanji(self, ch, lbl):
+        cols_wrap = self._cols_wrap
+        chars = self.kanji_dict.get(self.grade_var.get(), [])
+        rows  = ["".join(chars[i:i + cols_wrap])
+                 for i in range(0, len(chars), cols_wrap)]
+        text  = self.kanji_text
+        text.config(state="normal")
+        text.delete("1.0", "end")               # also drops old "selected" ranges
+        text.insert("1.0", "\n".join(rows))
+        for i, ch in enumerate(chars):          # re-mark earlier selections
+            if ch in self.selected_kanji:
+                text.tag_add("selected", f"{i // cols_wrap + 1}.{i % cols_wrap}")
+        # Text width is in average-char units; a kanji is ~2 of them
+        text.config(state="disabled", width=2 * cols_wrap, height=max(1, len(rows)))
+
+    def on_kanji_click(self, event):
+        text = self.kanji_text
+        idx  = text.index(f"@{event.x},{event.y}")
+        bbox = text.bbox(idx)
+        # ignore clicks in the blank area past the end of a short row
+        if not bbox or not bbox[0] <= event.x < bbox[0] + bbox[2]:
+            return
+        ch = text.get(idx)
+        if ch.strip():
+            self.toggle_kanji(ch, idx)
+
+    def toggle_kanji(self, ch, idx):
         if ch in self.selected_kanji:
             self.selected_kanji.remove(ch)
-            lbl.config(fg="black")
+            self.kanji_text.tag_remove("selected", idx)
         else:
             self.selected_kanji.add(ch)
-            lbl.config(fg="red")
+            self.kanji_text.tag_add("selected", idx)
 
     def toggle_style(self):
         if self.img_var.get() > 0:
@@ -166,22 +203,26 @@ class ReaderGUI(tk.Tk):
     # ----- generate button callback ----------------------
 
     def on_generate(self):
-        if not self.selected_kanji:
+        # selections from higher grades stay stored but can't be used here
+        grade = int(self.grade_var.get())
+        kanji = [k for k in self.selected_kanji if CHAR2GRADE[k] <= grade]
+        if not kanji:
             messagebox.showwarning("No kanji selected", "Please select at least one kanji.")
             return
         self.status.config(text="Running… please wait")
-        run_async(self.build_reader())
+        self.run_async(self.build_reader(grade, kanji))
 
-    async def build_reader(self):
+    async def build_reader(self, grade: int, kanji: list[str]):
         try:
             epub_path, html_path = await make_reader(
-                grade=int(self.grade_var.get()),
-                kanji=list(self.selected_kanji),
+                grade=grade,
+                kanji=kanji,
                 min_freq=self.rep_var.get(),
                 wc_range=(self.wmin.get(), self.wmax.get()),
                 n_pics=self.img_var.get(),
                 style=self.style_entry.get() or "Colored Pencil sketch",
-                idea=self.theme_var.get() or None
+                idea=self.theme_var.get() or None,
+                embed_images=False          # HTML stays next to its pictures
             )
             self.status.config(text=f"Done → {epub_path}")
             
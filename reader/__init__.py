@@ -2,9 +2,15 @@
 Reader package public surface.
 Importing `reader` will expose:
 
-    from reader import make_reader
+    from reader import make_reader, kanji_by_grade, KANJI_BY_GRADE
 """
 
 from .core import make_reader          # re-export top-level API
+from .core import make_reader_io, make_reader_cpu   # the two halves, for pools
+from .core import kanji_by_grade       # cached grade → kanji mapping
+from .core import CHAR2GRADE           # kanji → grade, built from the same table
+from .core import close_session        # closes per-loop HTTP/API clients
 
-__all__ = ["make_reader"]
\ No newline at end of file
+KANJI_BY_GRADE = kanji_by_grade()
+
+__all__ = ["make_reader", "make_reader_io", "make_reader_cpu", "close_session", "kanji_by_grade", "KANJI_BY_GRADE", "CHAR2GRADE"]
\ No newline at end of file
@@ -1,4 +1,7 @@
-import os, re, json, asyncio, io, pathlib, datetime, requests
+import os, re, asyncio, io, pathlib, datetime, hashlib, threading
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from PIL import Image
 
@@ -6,11 +9,9 @@ import openai
 import anthropic
 import jinja2, fugashi, pykakasi
 from ebooklib import epub
-from aiohttp import ClientSession
+from aiohttp import ClientSession, TCPConnector
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
-import unicodedata as ud
-
 #from playwright.async_api import async_playwright
 import tempfile, jaconv
 
@@ -29,10 +30,51 @@ OPENAI_MODEL_IMAGE = "dall-e-3"
 CLAUDE_MODEL_TEXT = "claude-haiku-4-5-20251001"  # see recommendations below
 CLAUDE_STORY_MODEL_TEXT = "claude-sonnet-4-6"
 openai.api_key = os.getenv("OPENAI_API_KEY")
-client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 
-env = Environment(loader=FileSystemLoader(TEMPLATE_DIR),autoescape=select_autoescape())
-KANJI = json.load(open(KANJI_JSON, encoding="utf-8"))
+env = Environment(loader=FileSystemLoader(TEMPLATE_DIR),autoescape=select_autoescape(),
+                  auto_reload=False)   # prompts only change with a deploy
+TPL_STORY = env.get_template("story.j2")
+TPL_SPLIT = env.get_template("split.j2")
+
+# async HTTP clients are bound to the loop that created them → one set per loop
+_LOOP_CLIENTS: dict[asyncio.AbstractEventLoop, dict[str, object]] = {}
+
+def _loop_client(name: str, factory):
+    "Client `name` for the running loop, created on first use."
+    clients = _LOOP_CLIENTS.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(name)
+    if client is None or getattr(client, "closed", False):
+        client = clients[name] = factory()
+    return client
+
+async def get_session() -> ClientSession:
+    "Shared aiohttp session for the running loop, created on first use."
+    return _loop_client("http", lambda: ClientSession(
+        connector=TCPConnector(limit=32, ttl_dns_cache=300)))
+
+async def get_openai() -> openai.AsyncOpenAI:
+    "Shared async OpenAI client for the running loop."
+    return _loop_client("openai",
+                        lambda: openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")))
+
+async def get_anthropic() -> anthropic.AsyncAnthropic:
+    "Shared async Claude client for the running loop."
+    return _loop_client("anthropic",
+                        lambda: anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY")))
+
+async def close_session():
+    "Close the running loop's shared clients (call before the loop exits)."
+    for c in _LOOP_CLIENTS.pop(asyncio.get_running_loop(), {}).values():
+        await c.close()
+
+@lru_cache(maxsize=1)
+def kanji_by_grade() -> dict[str, list[str]]:
+    "Parsed kanji_by_grade.json, loaded once per process."
+    return orjson.loads(KANJI_JSON.read_bytes())
+
+KANJI = kanji_by_grade()
+CHAR2GRADE = {ch: int(g) for g, lst in KANJI.items() for ch in lst}
+GRADE_SETS = {int(g): frozenset(lst) for g, lst in KANJI.items()}
 kakasi = pykakasi.kakasi()
 CHAR_THRESHOLD = 500   # tweak as taste
 # romaji vowel → hiragana we want to append
@@ -40,6 +82,7 @@ VOWEL2HIRA = {"a": "あ", "i": "い", "u": "う", "e": "い", "o": "う"}
 DEBUG_AI = True                    # switch to False in production
 MAX_PICS = 3
 MAX_RETRY_SPLIT = 2 
+HALVE_MIN_SIDE = 512               # pictures this small are embedded as-is
 
 HTML_TMPL = """<!DOCTYPE html>
 <html lang="ja">
@@ -109,40 +152,61 @@ div.pagebreak{{ break-after: page; }}
 {content}
 </body></html>
 """
+# only {content} varies → split once instead of str.format-ing the CSS per book
+_HTML_HEAD, _HTML_TAIL = (HTML_TMPL.replace("{{", "{").replace("}}", "}")
+                          .split("{content}"))
 
 
 # ---------- helpers ----------
+# fugashi nodes read their features from the tagger's lattice, which the next
+# parse overwrites → a tagger must never be shared between threads (the API
+# runs several generate jobs at once). One per thread, built on first use.
+_TAGGERS = threading.local()
+
 def make_tagger(dic: str = "lite") -> fugashi.GenericTagger:
     """
     dic = "lite"  → use the 6 MB unidic_lite dictionary
     dic = "full"  → use the big unidic dictionary
+    Cached per thread: GenericTagger init (dict mmap) is ~100 ms.
     """
+    tagger = getattr(_TAGGERS, dic, None)
+    if tagger is None:
+        tagger = _new_tagger(dic)
+        setattr(_TAGGERS, dic, tagger)
+    return tagger
+
+def _new_tagger(dic: str) -> fugashi.GenericTagger:
     if dic == "lite":
         import unidic_lite
         dicdir = pathlib.Path(unidic_lite.DICDIR)
-        rcfile = dicdir / "mecabrc"          # file exists in the wheel
-        os.environ["MECABRC"] = str(rcfile)  # ← add this line
-        # either give both -r and -d, or just -d (MeCab reads env var)
-        return fugashi.GenericTagger(f'-r "{rcfile}" -d "{dicdir}"')        
-        #dicdir = pathlib.Path(unidic_lite.DICDIR)      # .../unidic_lite/dicdir
-        # lite wheel already bundles a mini mecabrc → GenericTagger() is enough
-        #return fugashi.GenericTagger(f'-d "{dicdir}"')
-
     elif dic == "full":
         import unidic
-        dicdir  = pathlib.Path(unidic.DICDIR)          # .../unidic/dicdir
-        rcfile  = dicdir / "mecabrc"
-        os.environ["MECABRC"] = str(rcfile)            # ensure the right rc
-        return fugashi.GenericTagger(f'-d "{dicdir}"')
-
+        dicdir = pathlib.Path(unidic.DICDIR)          # .../unidic/dicdir
     else:
         raise ValueError("dic must be 'lite' or 'full'")
-tagger = make_tagger("lite")
+
+    rcfile = dicdir / "mecabrc"          # file exists in both wheels
+    if os.environ.get("MECABRC") != str(rcfile):
+        os.environ["MECABRC"] = str(rcfile)
+    # give both -r and -d so MeCab never falls back to a system mecabrc
+    return fugashi.GenericTagger(f'-r "{rcfile}" -d "{dicdir}"')
         
 def as_data_uri(img_bytes: bytes, mime: str = "image/jpeg") -> str:
     b64 = base64.b64encode(img_bytes).decode("ascii")
     return f"data:{mime};base64,{b64}"
     
+@lru_cache(maxsize=4096)
+def _last_vowel_of_kana(ch: str) -> str:
+    "Romaji vowel a single kana ends in (kakasi is slow, kana repeat a lot)."
+    r = kakasi.convert(ch)[0]["hepburn"]
+    return next((c for c in reversed(r) if c in "aiueo"), "u")
+
+@lru_cache(maxsize=4096)
+def _hira_of_token(surf: str) -> str:
+    "kakasi fallback reading for tokens MeCab gave no reading for."
+    return "".join(m["hira"] for m in kakasi.convert(surf))
+
+@lru_cache(maxsize=8192)             # readings repeat a lot (する, いる, …)
 def kata2hira_fix(text_kata: str) -> str:
     """
     Convert a katakana string to hiragana, expanding 'ー' to the
@@ -154,18 +218,18 @@ def kata2hira_fix(text_kata: str) -> str:
         if ch == "ー":
             if not out:        # leading 'ー' – ignore
                 continue
-            prev = out[-1]
             # Convert prev kana to romaji and grab last vowel
-            r = kakasi.convert(prev)[0]["hepburn"]
-            vowel = next((c for c in reversed(r) if c in "aiueo"), "u")
-            out.append(VOWEL2HIRA[vowel])
+            out.append(VOWEL2HIRA[_last_vowel_of_kana(out[-1])])
         else:
             out.append(ch)
     return "".join(out)
     
+_TAG_RE = re.compile(r"<[^>]+>")
+
 def plain_len(html: str) -> int:
     "Length of visible text, no tags."
-    return len(re.sub(r"<[^>]+>", "", html))
+    # subtract tag spans instead of building the stripped string
+    return len(html) - sum(m.end() - m.start() for m in _TAG_RE.finditer(html))
     
 def page_html(text_html: str, img_name: str | None, char_len: int) -> str:
     if img_name and char_len < CHAR_THRESHOLD:
@@ -189,18 +253,24 @@ def romaji_slug(text: str, maxlen: int = 50) -> str:
     - ASCII letters/digits kept as-is
     - Everything else → underscore
     """
-    roma = "".join(item["hepburn"] for item in kakasi.convert(text))
+    if text.isascii():                  # nothing for kakasi to transliterate
+        roma = text
+    else:
+        roma = "".join(item["hepburn"] for item in kakasi.convert(text))
     roma = re.sub(r"[^A-Za-z0-9]+", "_", roma).strip("_").lower()
     return roma[:maxlen] or "untitled"
     
 def is_kana(ch: str) -> bool:
-    return "HIRAGANA" in ud.name(ch, "") or "KATAKANA" in ud.name(ch, "")
+    o = ord(ch)
+    if o < 0x3041:                      # ASCII, punctuation, CJK symbols
+        return False
+    return (0x3041 <= o <= 0x3096 or 0x3099 <= o <= 0x30FF     # hiragana, katakana, ー
+            or 0x31F0 <= o <= 0x31FF or 0xFF65 <= o <= 0xFF9F) # small ext., half-width
     
 def build_full_html(html_pieces:list[str])->str:
-    joined = ""
-    for block in html_pieces:
-        joined += f"<div>{block}</div><div class='pagebreak'></div>"
-    return HTML_TMPL.format(content=joined)
+    joined = "".join(f"<div>{block}</div><div class='pagebreak'></div>"
+                     for block in html_pieces)
+    return _HTML_HEAD + joined + _HTML_TAIL
 
 #async def html_to_pdf(html:str, outfile:str, page_size:str="A4"):
 #    async with async_playwright() as p:
@@ -214,15 +284,17 @@ def build_full_html(html_pieces:list[str])->str:
 #        await browser.close()
         
 def is_kanji(c):
-    return "CJK UNIFIED" in ud.name(c, "")
+    o = ord(c)
+    if o < 0x3400:                      # ASCII, punctuation, kana
+        return False
+    return (0x4E00 <= o <= 0x9FFF or 0x3400 <= o <= 0x4DBF          # URO, ext. A
+            or 0x20000 <= o <= 0x2EBEF or 0x30000 <= o <= 0x323AF)  # ext. B–H
 
 def grade_of(ch):
-    if not is_kanji(ch):
-        return None
-    for g, lst in KANJI.items():
-        if ch in lst:
-            return int(g)
-    return 99  
+    g = CHAR2GRADE.get(ch)
+    if g is not None:
+        return g
+    return 99 if is_kanji(ch) else None      # unlisted kanji → never allowed
 
 def sanitize(text:str, max_grade:int)->str:
     """
@@ -230,23 +302,45 @@ def sanitize(text:str, max_grade:int)->str:
     with its hiragana reading.
     """
     out = []
-    for tok in tagger(text):
-        if any(is_kanji(ch) and grade_of(ch) and grade_of(ch) > max_grade
+    for tok in make_tagger()(text):
+        if any((g := grade_of(ch)) is not None and g > max_grade
             for ch in tok.surface):
                 if len(tok.feature) > 9 and tok.feature[9]:
                     reading = kata2hira_fix(tok.feature[9])
                 else:
-                    reading = "".join(m["hira"] for m in kakasi.convert(tok.surface))     
+                    reading = _hira_of_token(tok.surface)
                 #reading = reading.lower().replace("ー","")            
                 out.append(reading)
         else:
             out.append(tok.surface)
     return "".join(out)
     
+def _ruby(surf: str, reading: str) -> str:
+    "Wrap `surf` in <ruby>, leaving okurigana that match the reading outside."
+    # --- NEW: strip okurigana that match reading tail ---
+    i = 1
+    while i <= len(surf) and i <= len(reading):
+        if is_kana(surf[-i]) and surf[-i] == reading[-i]:
+            i += 1
+        else:
+            break
+    okuri_len = i - 1          # number of kana chars to strip
+    if okuri_len:
+        core_surf   = surf[:-okuri_len]
+        core_read   = reading[:-okuri_len]
+        okurigana   = surf[-okuri_len:]
+    else:
+        core_surf, core_read, okurigana = surf, reading, ""
+
+    # Guard: avoid empty ruby (rare OOV edge)
+    if not core_read:
+        return surf
+    return f"<ruby>{core_surf}<rt>{core_read}</rt></ruby>{okurigana}"
+
 def inject_ruby(text: str, grade: int) -> str:
-    grade_set = set(KANJI[str(grade)])
+    grade_set = GRADE_SETS[grade]
     out = []
-    for tok in tagger(text):
+    for tok in make_tagger()(text):
         surf = tok.surface
         # Do we need ruby at all?
         if not any(c in grade_set for c in surf):
@@ -257,40 +351,39 @@ def inject_ruby(text: str, grade: int) -> str:
         if len(tok.feature) > 9 and tok.feature[9]:
             reading = kata2hira_fix(tok.feature[9])
         else:
-            reading = "".join(m["hira"] for m in kakasi.convert(surf))  
-
-        # --- NEW: strip okurigana that match reading tail ---
-        i = 1
-        while i <= len(surf) and i <= len(reading):
-            if is_kana(surf[-i]) and surf[-i] == reading[-i]:
-                i += 1
-            else:
-                break
-        okuri_len = i - 1          # number of kana chars to strip
-        if okuri_len:
-            core_surf   = surf[:-okuri_len]
-            core_read   = reading[:-okuri_len]
-            okurigana   = surf[-okuri_len:]
-        else:
-            core_surf, core_read, okurigana = surf, reading, ""
+            reading = _hira_of_token(surf)
+        out.append(_ruby(surf, reading))
+    return "".join(out)
 
-        # Guard: avoid empty ruby (rare OOV edge)
-        if not core_read:
+def sanitize_and_ruby(text: str, grade: int) -> str:
+    """
+    inject_ruby(sanitize(text, grade), grade) in a single MeCab pass:
+    tokens with kanji above `grade` become hiragana, tokens with kanji
+    of exactly `grade` get ruby, everything else is kept as is.
+    """
+    grade_set = GRADE_SETS[grade]
+    out = []
+    for tok in make_tagger()(text):
+        surf = tok.surface
+        above = any((g := grade_of(ch)) is not None and g > grade for ch in surf)
+        if not above and not any(c in grade_set for c in surf):
             out.append(surf)
+            continue
+
+        if len(tok.feature) > 9 and tok.feature[9]:
+            reading = kata2hira_fix(tok.feature[9])
         else:
-            ruby = f"<ruby>{core_surf}<rt>{core_read}</rt></ruby>{okurigana}"
-            out.append(ruby)
+            reading = _hira_of_token(surf)
+        out.append(reading if above else _ruby(surf, reading))
     return "".join(out)
 
 def validate_story(txt:str, grade:int, kanji:list[str], min_freq:int):
-    counts = {k:0 for k in kanji}
-    for ch in txt:
+    for ch in set(txt):                 # each distinct character once
         g = grade_of(ch)
         if g and g > grade:
             raise ValueError(f"Disallowed kanji {ch}")
-        if ch in counts:
-            counts[ch]+=1
-    for k,c in counts.items():
+    for k in kanji:
+        c = txt.count(k)                # C-level scan; |kanji| is tiny
         if c < min_freq:
             raise ValueError(f"{k} appears {c} < required {min_freq}")
 
@@ -312,8 +405,7 @@ def dump_ai(kind: str, slug: str, resp):
     else:                                      # fallback for older
         raw = resp
 
-    with open(fname, "w", encoding="utf-8") as fp:
-        json.dump(raw, fp, ensure_ascii=False, indent=2)
+    fname.write_bytes(orjson.dumps(raw, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
     print(f"📝 debug: saved {fname.relative_to(DBG_DIR.parent)}")
 def dump_prompt(kind: str, slug: str, prompt: str):
     """
@@ -329,19 +421,35 @@ def dump_prompt(kind: str, slug: str, prompt: str):
         fp.write(prompt)
     print(f"📝 debug: saved {fname.relative_to(DBG_DIR.parent)}")
     
+_HALVED: dict[bytes, bytes] = {}   # blake2b digest → halved JPEG (retries)
+_HALVED_LOCK = threading.Lock()    # halve_image runs in make_reader_cpu's threads
+
 def halve_image(img_bytes: bytes) -> bytes:
     """
-    Return a new JPEG at half the width/height of the original.
+    Return a JPEG at half the width/height of the original.
     Keeps EXIF orientation; quality=85 is a good compromise.
+    Already-small JPEGs are returned unchanged; anything else (DALL-E
+    sends PNG) is always re-encoded, since callers label it image/jpeg.
     """
+    key = hashlib.blake2b(img_bytes, digest_size=16).digest()
+    if (hit := _HALVED.get(key)) is not None:
+        return hit
     with Image.open(io.BytesIO(img_bytes)) as im:
         w, h = im.size
-        im = im.resize((w // 2, h // 2), Image.LANCZOS)
+        if w <= HALVE_MIN_SIDE and h <= HALVE_MIN_SIDE and im.format == "JPEG":
+            return img_bytes
+        im = im.resize((w // 2, h // 2), Image.Resampling.LANCZOS)
         buf = io.BytesIO()
-        im.save(buf, format="JPEG", quality=85, dpi=(72, 72), optimize=True)
-        return buf.getvalue()    
+        # optimize=True is an extra encoder pass for a few % on a thumbnail
+        im.save(buf, format="JPEG", quality=85, dpi=(72, 72))
+        small = buf.getvalue()
+    with _HALVED_LOCK:
+        if len(_HALVED) >= 16:
+            _HALVED.pop(next(iter(_HALVED)), None)
+        _HALVED[key] = small
+    return small
         
-def generate_series_via_chat(prompts: list[str], style: str):
+async def generate_series_via_chat(prompts: list[str], style: str):
     """
     prompts : list of scene prompts (already include [TAGS] + style keyword)
     Returns : list of (prompt, jpeg-bytes)
@@ -354,19 +462,20 @@ def generate_series_via_chat(prompts: list[str], style: str):
             "Use the user's prompt exactly, do not invent new details."}
     ]
 
+    oai, session = await get_openai(), await get_session()
     results = []
     for p in prompts:
         messages.append({"role": "user", "content": p})
-        resp = openai.chat.completions.create(
+        resp = await oai.chat.completions.create(
             model="dall-e-3",
             messages=messages
         )
         messages.append(resp.choices[0].message)        # keep context
 
         # extract URL from assistant JSON
-        data = json.loads(resp.choices[0].message.content)
+        data = orjson.loads(resp.choices[0].message.content)
         url  = data["url"]
-        img_bytes = requests.get(url).content
+        img_bytes = await download_image(url, session)
         results.append((p, img_bytes))
 
     return results  
@@ -384,10 +493,20 @@ async def download_image(url, session):
     async with session.get(url) as r:
         r.raise_for_status()
         return await r.read()
+
+async def generate_image(idx: int, prompt: str, slug: str) -> bytes:
+    "One DALL-E call plus download; run several of these in a TaskGroup."
+    dump_prompt(f"image{idx}", slug, prompt)
+    gen = await (await get_openai()).images.generate(
+        model=OPENAI_MODEL_IMAGE,
+        prompt=prompt, n=1, size="1024x1024"
+    )
+    dump_ai(f"image{idx}", slug, gen)
+    return await download_image(gen.data[0].url, await get_session())
     
 
 # ---------- main test-driver ----------
-async def make_reader(
+async def make_reader_io(
     *,
     grade:int,
     kanji:list[str],
@@ -395,11 +514,14 @@ async def make_reader(
     wc_range:tuple[int,int],
     n_pics:int,
     style:str,
-    idea:str|None=None,
-    out_dir=OUTPUT_DIR
-):
+    idea:str|None=None
+) -> dict:
+    """
+    Network-bound half of make_reader: story, split and image calls.
+    Returns a picklable draft for make_reader_cpu.
+    """
     # Step I : load story.txt
-    story_prompt = env.get_template("story.j2").render(
+    story_prompt = TPL_STORY.render(
         grade=grade, kanji_list=kanji, min_freq=min_freq,
         wc_min=wc_range[0], wc_max=wc_range[1], idea=idea
     )
@@ -409,7 +531,8 @@ async def make_reader(
     #    temperature=0.7
     #)
     #data = json.loads(resp_story.choices[0].message.content)
-    resp_story = client.messages.create(
+    claude = await get_anthropic()
+    resp_story = await claude.messages.create(
         model=CLAUDE_STORY_MODEL_TEXT,
         max_tokens=4096,
         messages=[{"role": "user", "content": story_prompt}],
@@ -419,14 +542,12 @@ async def make_reader(
     if raw_story.startswith("```"):
         raw_story = re.sub(r"^```[^\n]*\n?", "", raw_story)
         raw_story = re.sub(r"\n?```$", "", raw_story.strip())
-    data = json.loads(raw_story)
+    data = orjson.loads(raw_story)
     title       = data["title"].strip()
     story_raw   = data["story"].split("###END###")[0].strip()
     story_clean = sanitize(story_raw, grade)
     #validate_story(story_clean, grade, kanji, min_freq)
     slug      = romaji_slug(title)
-    filename  = f"{slug}.epub"
-    pdf_file  = f"{slug}.pdf"
     dump_prompt("story", slug, story_prompt)     
     dump_ai("story", slug, resp_story)    
 
@@ -434,7 +555,7 @@ async def make_reader(
     n_pics = MAX_PICS if n_pics > MAX_PICS else n_pics    
     if n_pics > 0:
         
-        split_prompt = env.get_template("split.j2").render(
+        split_prompt = TPL_SPLIT.render(
             pieces=n_pics, style=style, story=story_clean
         )
         dump_prompt("split", slug, split_prompt)     
@@ -445,7 +566,7 @@ async def make_reader(
             #    messages=[{"role":"user","content":split_prompt}],
             #    temperature=0.5
             #) 
-            resp_split = client.messages.create(
+            resp_split = await claude.messages.create(
                 model=CLAUDE_MODEL_TEXT,
                 max_tokens=4096,
                 messages=[{"role": "user", "content": split_prompt}],
@@ -458,7 +579,7 @@ async def make_reader(
             if raw_split.startswith("```"):
                 raw_split = re.sub(r"^```[^\n]*\n?", "", raw_split)
                 raw_split = re.sub(r"\n?```$", "", raw_split.strip())
-            pieces_obj = json.loads(raw_split)
+            pieces_obj = orjson.loads(raw_split)
             pieces = pieces_obj["pieces"]               # [{text:, prompt:}, …]
             expected = n_pics
                 # ---------- validation ----------
@@ -487,22 +608,22 @@ async def make_reader(
 
 
         #imgs = []
-        #for pr, img_bytes in generate_series_via_chat(prompts, style_kw):
+        #for pr, img_bytes in await generate_series_via_chat(prompts, style_kw):
         #    dump_prompt(f"image{len(imgs)+1}", slug, pr)    # debug
         #    imgs.append(img_bytes)
         
-        imgs = []
-        for idx, p in enumerate(pieces, 1):
-            prompt = f"{{{{'Art style': {style}}}, {p['prompt']}}}"
-            dump_prompt(f"image{idx}", slug, prompt)
-
-            gen = openai.images.generate(
-                model="dall-e-3",
-                prompt=prompt, n=1, size="1024x1024"
-            )
-            dump_ai(f"image{idx}", slug, gen)
-            img_bytes = requests.get(gen.data[0].url).content
-            imgs.append(img_bytes)        
+        # all DALL-E calls in flight at once (each takes 10–30 s); the
+        # TaskGroup cancels the rest as soon as one fails
+        try:
+            async with asyncio.TaskGroup() as tg:
+                img_tasks = [
+                    tg.create_task(generate_image(
+                        idx, f"{{{{'Art style': {style}}}, {p['prompt']}}}", slug))
+                    for idx, p in enumerate(pieces, 1)
+                ]
+        except ExceptionGroup as eg:
+            raise eg.exceptions[0]      # callers report str(exc); keep it plain
+        imgs = [t.result() for t in img_tasks]
         #img_tasks = []
         #async with ClientSession() as session:
         #    for i, p in enumerate(pieces, 1):
@@ -521,9 +642,24 @@ async def make_reader(
         pieces = [{"index": 1, "text": story_clean, "prompt": ""}]
         imgs = [None]
     #imgs = [None] if len(pieces) == 1 else await load_images(len(pieces))
+    return {"title": title, "slug": slug, "grade": grade,
+            "pieces": pieces, "imgs": imgs}
+
+def make_reader_cpu(draft: dict, out_dir=OUTPUT_DIR,
+                    embed_images: bool = True) -> tuple[Path, Path]:
+    """
+    CPU-bound half of make_reader: ruby injection, EPUB and HTML output.
+    Plain function so it can run in a worker process.
+    embed_images=False writes the preview pictures next to the HTML
+    instead of inlining them as base64 (only for a kept out_dir).
+    """
+    title, slug, grade = draft["title"], draft["slug"], draft["grade"]
+    pieces, imgs = draft["pieces"], draft["imgs"]
+    filename  = f"{slug}.epub"
+    pdf_file  = f"{slug}.pdf"
 
     # Step IV : ruby injection
-    html_pieces = [inject_ruby(sanitize(p["text"], grade), grade) for p in pieces]
+    html_pieces = [sanitize_and_ruby(p["text"], grade) for p in pieces]
 
     # Step V : build EPUB (vertical-rl)
     book = epub.EpubBook()
@@ -541,7 +677,11 @@ img{max-width:100%;}div.pagebreak{page-break-after:always;}"""
 
     spine = []
     pdf_pages = []  
-    for i, (html, img_bytes) in enumerate(zip(html_pieces, imgs), 1):
+    # Pillow releases the GIL while resizing/encoding → halve all pictures at once
+    with ThreadPoolExecutor() as ex:
+        smalls = list(ex.map(lambda b: None if b is None else halve_image(b), imgs))
+
+    for i, (html, img_bytes, sm_bytes) in enumerate(zip(html_pieces, imgs, smalls), 1):
         # 1️ always add the picture to manifest
         if img_bytes is not None:
             img_uid  = f"img{i}"
@@ -553,14 +693,16 @@ img{max-width:100%;}div.pagebreak{page-break-after:always;}"""
             book.add_item(img_item)
 
             epub_src = img_name
-            sm_bytes = halve_image(img_bytes) 
-            data_uri = as_data_uri(sm_bytes)
+            if embed_images:            # single-file HTML (API download)
+                data_uri = as_data_uri(sm_bytes)
+            else:                       # browser loads it from disk
+                data_uri = f"{slug}_p{i}_sm.jpg"
+                (out_dir / data_uri).write_bytes(sm_bytes)
         else:
             img_name = epub_src = data_uri = None
         
         # 2️ Decide layout
         short = plain_len(html) < CHAR_THRESHOLD
-        pages_html = []
 
         if short and img_bytes is not None:
             # side-by-side single page
@@ -596,48 +738,66 @@ img{max-width:100%;}div.pagebreak{page-break-after:always;}"""
                 book.add_item(img_page)
                 spine.append(img_page)
                 pdf_pages.append(img_sec)
-        
-        pdf_pages.extend(pages_html)
-        # 3️ Emit each <section> as its own XHTML file & add to spine
-        for j, sec in enumerate(pages_html, 1):
-            file_name = f"p{i}_{j}.xhtml"
-            page = epub.EpubHtml(title=f"p{i}_{j}", file_name=file_name, lang="ja")
-            page.content = sec
-            page.add_item(css)
-            book.add_item(page)
-            spine.append(page)
-
 
     book.spine = ["nav"] + spine
     book.add_item(epub.EpubNcx()); book.add_item(epub.EpubNav())
 
     epub_path = out_dir / filename
-    epub.write_epub(epub_path, book)
+    # write_epub spends its time in zlib (GIL released) → overlap Step VI with it
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        epub_job = ex.submit(epub.write_epub, epub_path, book)
+
+        # ─ Step VI : PDF ─
+        #full_html = build_full_html(html_pieces)
+        full_html = build_full_html(pdf_pages)
+        html_file = f"{slug}.html"
+        html_path = out_dir / html_file
+        with open(html_path, "w", encoding="utf-8") as fp:
+            fp.write(full_html)   
+
+        epub_job.result()
     print("✅ EPUB written to", epub_path)
-    
-    # ─ Step VI : PDF ─
-    #full_html = build_full_html(html_pieces)
-    full_html = build_full_html(pdf_pages)
-    html_file = f"{slug}.html"
-    html_path = out_dir / html_file
-    with open(html_path, "w", encoding="utf-8") as fp:
-        fp.write(full_html)   
     #pdf_path = out_dir / pdf_file      
     #this isnt neccessary
     #await html_to_pdf(full_html, pdf_path)
 
     return (epub_path, html_path)
 
+async def make_reader(
+    *,
+    grade:int,
+    kanji:list[str],
+    min_freq:int,
+    wc_range:tuple[int,int],
+    n_pics:int,
+    style:str,
+    idea:str|None=None,
+    out_dir=OUTPUT_DIR,
+    embed_images:bool=True
+):
+    draft = await make_reader_io(
+        grade=grade, kanji=kanji, min_freq=min_freq, wc_range=wc_range,
+        n_pics=n_pics, style=style, idea=idea
+    )
+    return await asyncio.to_thread(make_reader_cpu, draft, out_dir, embed_images)
+
 
 # ---------- quick manual test ----------
 if __name__ == "__main__":
     import asyncio
-    asyncio.run(make_reader(
-        grade=3,
-        kanji=["海","魚","強"],
-        min_freq=5,
-        wc_range=(2000, 3000),
-        n_pics=0,
-        style="Colored Pencil sketch",
-        idea=None
-    ))
+
+    async def _main():
+        try:
+            await make_reader(
+                grade=3,
+                kanji=["海","魚","強"],
+                min_freq=5,
+                wc_range=(2000, 3000),
+                n_pics=0,
+                style="Colored Pencil sketch",
+                idea=None
+            )
+        finally:
+            await close_session()
+
+    asyncio.run(_main())
@@ -4,7 +4,10 @@
 # Uses local files instead of OpenAI API calls so you can
 # exercise the ruby injection, validation, and EPUB logic.
 
-import os, re, json, asyncio, io, pathlib
+import os, re, asyncio, io, pathlib, hashlib, threading
+import orjson
+from collections import Counter
+from functools import lru_cache
 from pathlib import Path
 from PIL import Image
 
@@ -12,8 +15,6 @@ import fugashi, pykakasi, unidic
 from ebooklib import epub
 from aiohttp import ClientSession
 
-import unicodedata as ud
-
 from playwright.async_api import async_playwright
 import tempfile, jaconv
 
@@ -27,13 +28,31 @@ IMG_PATTERN = "img{index}.jpg"       # img1.jpg, img2.jpg …
 OUTPUT_FOLDER = "books"
 
 # ---------- static data ----------
-KANJI = json.load(open(KANJI_JSON, encoding="utf-8"))
+KANJI = orjson.loads(KANJI_JSON.read_bytes())
+GRADE_SETS = {int(g): frozenset(lst) for g, lst in KANJI.items()}
 dic_dir = pathlib.Path(unidic.DICDIR)
 os.environ["MECABRC"] = str(dic_dir / "mecabrc")   # ← key line
 kakasi = pykakasi.kakasi()
 CHAR_THRESHOLD = 500   # tweak as taste
+# halve_image: smaller pictures are reused as-is (px). Higher than core's 512:
+# core's halved copy is what API clients download, here it only feeds the
+# local PDF/HTML preview, so sharing the original bytes is the better trade
+HALVE_MIN_SIDE = 1600
 # romaji vowel → hiragana we want to append
 VOWEL2HIRA = {"a": "あ", "i": "い", "u": "う", "e": "い", "o": "う"}
+# hiragana → vowel it ends in, for expanding 'ー' (ん/unknown → "u")
+KANA2VOWEL = {ch: v for v, row in (
+    ("a", "あかがさざただなはばぱまやらわぁゃゎゕ"),
+    ("i", "いきぎしじちぢにひびぴみりぃゐ"),
+    ("u", "うくぐすずつづぬふぶぷむゆるぅゅっゔ"),
+    ("e", "えけげせぜてでねへべぺめれぇゑゖ"),
+    ("o", "おこごそぞとどのほぼぽもよろをぉょ"),
+) for ch in row}
+
+# same ranges as reader.core.is_kana: hiragana, sound marks, katakana
+# (incl. ・ ー ヽ ヾ), small katakana ext. and half-width katakana
+KANA_SET = frozenset(map(chr, [*range(0x3041, 0x3097), *range(0x3099, 0x3100),
+                               *range(0x31F0, 0x3200), *range(0xFF65, 0xFFA0)]))
 
 HTML_TMPL = """<!DOCTYPE html>
 <html lang="ja">
@@ -43,7 +62,7 @@ HTML_TMPL = """<!DOCTYPE html>
 @font-face{{
   font-family: "NotoSerifJP";
   src: local("Noto Serif JP Regular"),
-       url("https://fonts.gstatic.com/ea/notoserifjpv8/NotoSerifJP-Regular.otf")
+       url("{font_url}")
        format("opentype");
 }}
 html{{
@@ -103,6 +122,15 @@ div.pagebreak{{ break-after: page; }}
 {content}
 </body></html>
 """
+# a local copy of the font is inlined into the HTML handed to Chromium, so
+# PDF rendering never waits on the network (the .html preview keeps the URL)
+FONT_FILE = BASE / "NotoSerifJP-Regular.otf"
+FONT_URL  = "https://fonts.gstatic.com/ea/notoserifjpv8/NotoSerifJP-Regular.otf"
+
+# only {content} varies → split once instead of str.format-ing the CSS per book
+_HTML_HEAD, _HTML_TAIL = (HTML_TMPL.replace("{font_url}", FONT_URL)
+                          .replace("{{", "{").replace("}}", "}")
+                          .split("{content}"))
 
 
 # ---------- helpers ----------
@@ -143,18 +171,17 @@ def kata2hira_fix(text_kata: str) -> str:
         if ch == "ー":
             if not out:        # leading 'ー' – ignore
                 continue
-            prev = out[-1]
-            # Convert prev kana to romaji and grab last vowel
-            r = kakasi.convert(prev)[0]["hepburn"]
-            vowel = next((c for c in reversed(r) if c in "aiueo"), "u")
-            out.append(VOWEL2HIRA[vowel])
+            out.append(VOWEL2HIRA[KANA2VOWEL.get(out[-1], "u")])
         else:
             out.append(ch)
     return "".join(out)
     
+_TAG_RE = re.compile(r"<[^>]+>")
+
 def plain_len(html: str) -> int:
     "Length of visible text, no tags."
-    return len(re.sub(r"<[^>]+>", "", html))
+    # subtract tag spans instead of building the stripped string
+    return len(html) - sum(m.end() - m.start() for m in _TAG_RE.finditer(html))
     
 def page_html(text_html: str, img_name: str | None, char_len: int) -> str:
     if img_name and char_len < CHAR_THRESHOLD:
@@ -171,6 +198,8 @@ def page_html(text_html: str, img_name: str | None, char_len: int) -> str:
             html += f"<section class='picture'><img src='{img_name}' alt=''></section>"
         return html
         
+_SLUG_RE = re.compile(r"[^A-Za-z0-9]+")
+
 def romaji_slug(text: str, maxlen: int = 50) -> str:
     """
     Convert Japanese or mixed text to a filesystem-safe romaji slug.
@@ -178,132 +207,242 @@ def romaji_slug(text: str, maxlen: int = 50) -> str:
     - ASCII letters/digits kept as-is
     - Everything else → underscore
     """
-    roma = "".join(item["hepburn"] for item in kakasi.convert(text))
-    roma = re.sub(r"[^A-Za-z0-9]+", "_", roma).strip("_").lower()
+    if text.isascii():                  # nothing for kakasi to transliterate
+        roma = text
+    else:
+        roma = "".join(item["hepburn"] for item in kakasi.convert(text))
+    roma = _SLUG_RE.sub("_", roma).strip("_").lower()
     return roma[:maxlen] or "untitled"
     
-def is_kana(ch: str) -> bool:
-    return "HIRAGANA" in ud.name(ch, "") or "KATAKANA" in ud.name(ch, "")
-    
 def build_full_html(html_pieces:list[str])->str:
-    joined = ""
-    for block in html_pieces:
-        joined += f"<div>{block}</div><div class='pagebreak'></div>"
-    return HTML_TMPL.format(content=joined)
+    joined = "".join(f"<div>{block}</div><div class='pagebreak'></div>"
+                     for block in html_pieces)
+    return _HTML_HEAD + joined + _HTML_TAIL
+
+# one Chromium per process: launched on first use, reused by every PDF
+_PW = None
+_BROWSER = None
+_BROWSER_LAUNCH = None     # the launching task, so concurrent callers share it
+
+async def _launch_browser():
+    global _PW, _BROWSER
+    _PW = await async_playwright().start()
+    _BROWSER = await _PW.chromium.launch()
+    return _BROWSER
+
+async def _get_browser():
+    global _BROWSER_LAUNCH
+    if _BROWSER_LAUNCH is None:
+        _BROWSER_LAUNCH = asyncio.ensure_future(_launch_browser())
+    try:
+        # shield: a cancelled caller must not abort the shared launch halfway
+        return await asyncio.shield(_BROWSER_LAUNCH)
+    except Exception:
+        _BROWSER_LAUNCH = None             # let the next call retry
+        raise
+
+async def shutdown_pdf():
+    "Close the shared browser (call once, before the event loop ends)."
+    global _PW, _BROWSER, _BROWSER_LAUNCH
+    if _BROWSER_LAUNCH is not None and not _BROWSER_LAUNCH.done():
+        await asyncio.wait([_BROWSER_LAUNCH])   # let it finish, then close it
+    if _BROWSER is not None:
+        await _BROWSER.close()
+    if _PW is not None:
+        await _PW.stop()
+    _PW = _BROWSER = _BROWSER_LAUNCH = None
+
+@lru_cache(maxsize=1)
+def _font_data_uri() -> str | None:
+    "FONT_FILE as a data: URI, encoded on first use; None when not shipped."
+    if not FONT_FILE.exists():
+        return None
+    return "data:font/otf;base64," + base64.b64encode(FONT_FILE.read_bytes()).decode("ascii")
 
 async def html_to_pdf(html:str, outfile:str, page_size:str="A4", landscape: bool = True):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch()
-        page = await browser.new_page()
-        await page.set_content(html, wait_until="networkidle")
+    if (font := _font_data_uri()) is not None:
+        html = html.replace(FONT_URL, font, 1)
+    browser = await _get_browser()
+    page = await browser.new_page()
+    try:
+        # images are data URIs → "load" is enough; only the web font may
+        # still be in flight, and fonts.ready waits for just that
+        await page.set_content(html, wait_until="load")
+        await page.evaluate("document.fonts.ready.then(() => true)")
         await page.pdf(path=outfile,
                        format=page_size,
                        landscape=landscape,
                        margin={"top":"0","bottom":"0","left":"0","right":"0"},
                        print_background=True)
-        await browser.close()
+    finally:
+        await page.close()
         
 def is_kanji(c):
-    return "CJK UNIFIED" in ud.name(c, "")
+    o = ord(c)
+    return (0x4E00 <= o <= 0x9FFF or 0x3400 <= o <= 0x4DBF          # URO, ext. A
+            or 0x20000 <= o <= 0x2EBEF or 0x30000 <= o <= 0x323AF)  # ext. B–H
+
+@lru_cache(maxsize=8)
+def allowed_kanji(max_grade: int) -> frozenset[str]:
+    "Every listed kanji of grade ≤ max_grade."
+    return frozenset(ch for g, lst in KANJI.items() if int(g) <= max_grade
+                     for ch in lst)
+
+# MeCab's raw feature string → reading; tok.feature CSV-splits per node,
+# so repeated tokens (most of a story) skip that by hitting this dict.
+# Bounded like the lru_caches below, oldest entry evicted first.
+_KANA_BY_FEATURE: dict[str, str] = {}
+
+def _kana_field(tok) -> str:
+    "MeCab's katakana reading for a token, or '' when it has none."
+    raw = tok.feature_raw
+    kana = _KANA_BY_FEATURE.get(raw)
+    if kana is None:
+        if len(_KANA_BY_FEATURE) >= 20000:
+            _KANA_BY_FEATURE.pop(next(iter(_KANA_BY_FEATURE)))
+        feat = tok.feature
+        kana = _KANA_BY_FEATURE[raw] = feat[9] if len(feat) > 9 and feat[9] else ""
+    return kana
+
+@lru_cache(maxsize=8192)
+def _hira_of(surf: str) -> str:
+    "kakasi reading for tokens MeCab gave no reading for."
+    return "".join(m["hira"] for m in kakasi.convert(surf))
+
+def _hira_reading(surf: str, kana: str) -> str:
+    "Hiragana reading: MeCab's if present, kakasi as fallback."
+    if kana:
+        return kata2hira_fix(kana)
+    return _hira_of(surf)
+
+# Stories repeat the same tokens (particles, names, common verbs) over and
+# over → the per-token work below is cached on (surface, reading, grade).
+
+def _has_disallowed(surf: str, max_grade: int) -> bool:
+    allowed = allowed_kanji(max_grade)
+    # unlisted kanji are never in `allowed`, same as grade 99 before
+    return any(ch not in allowed and is_kanji(ch) for ch in surf)
+
+@lru_cache(maxsize=20000)
+def _sanitize_token(surf: str, kana: str, max_grade: int) -> str:
+    if _has_disallowed(surf, max_grade):
+        return _hira_reading(surf, kana)
+    return surf
+
+@lru_cache(maxsize=20000)
+def _ruby_for_token(surf: str, kana: str, grade: int) -> str:
+    # Do we need ruby at all?
+    if not any(c in GRADE_SETS[grade] for c in surf):
+        return surf
+
+    # Get reading in hiragana
+    reading = _hira_reading(surf, kana)
+
+    # --- NEW: strip okurigana that match reading tail ---
+    # common kana suffix of surface and reading; plain set lookups only
+    okuri_len, n = 0, min(len(surf), len(reading))
+    while (okuri_len < n and surf[-1 - okuri_len] == reading[-1 - okuri_len]
+           and surf[-1 - okuri_len] in KANA_SET):
+        okuri_len += 1         # number of kana chars to strip
+    if okuri_len:
+        core_surf   = surf[:-okuri_len]
+        core_read   = reading[:-okuri_len]
+        okurigana   = surf[-okuri_len:]
+    else:
+        core_surf, core_read, okurigana = surf, reading, ""
 
-def grade_of(ch):
-    if not is_kanji(ch):
-        return None
-    for g, lst in KANJI.items():
-        if ch in lst:
-            return int(g)
-    return 99  
+    # Guard: avoid empty ruby (rare OOV edge)
+    if not core_read:
+        return surf
+    return f"<ruby>{core_surf}<rt>{core_read}</rt></ruby>{okurigana}"
 
 def sanitize(text:str, max_grade:int)->str:
     """
     Replace every token that contains a kanji above `max_grade`
     with its hiragana reading.
     """
-    out = []
-    for tok in tagger(text):
-        if any(is_kanji(ch) and grade_of(ch) and grade_of(ch) > max_grade
-            for ch in tok.surface):
-                if len(tok.feature) > 9 and tok.feature[9]:
-                    reading = kata2hira_fix(tok.feature[9])
-                else:
-                    reading = "".join(m["hira"] for m in kakasi.convert(tok.surface))     
-                #reading = reading.lower().replace("ー","")            
-                out.append(reading)
-        else:
-            out.append(tok.surface)
-    return "".join(out)
+    return "".join(_sanitize_token(tok.surface, _kana_field(tok), max_grade)
+                   for tok in tagger(text))
     
 def inject_ruby(text: str, grade: int) -> str:
-    grade_set = set(KANJI[str(grade)])
-    out = []
-    for tok in tagger(text):
-        surf = tok.surface
-        # Do we need ruby at all?
-        if not any(c in grade_set for c in surf):
-            out.append(surf)
-            continue
-
-        # Get reading in hiragana
-        if len(tok.feature) > 9 and tok.feature[9]:
-            reading = kata2hira_fix(tok.feature[9])
-        else:
-            reading = "".join(m["hira"] for m in kakasi.convert(surf))  
+    return "".join(_ruby_for_token(tok.surface, _kana_field(tok), grade)
+                   for tok in tagger(text))
 
-        # --- NEW: strip okurigana that match reading tail ---
-        i = 1
-        while i <= len(surf) and i <= len(reading):
-            if is_kana(surf[-i]) and surf[-i] == reading[-i]:
-                i += 1
-            else:
-                break
-        okuri_len = i - 1          # number of kana chars to strip
-        if okuri_len:
-            core_surf   = surf[:-okuri_len]
-            core_read   = reading[:-okuri_len]
-            okurigana   = surf[-okuri_len:]
-        else:
-            core_surf, core_read, okurigana = surf, reading, ""
+@lru_cache(maxsize=20000)
+def _sanitize_ruby_token(surf: str, kana: str, grade: int) -> str:
+    if _has_disallowed(surf, grade):
+        return _hira_reading(surf, kana)
+    return _ruby_for_token(surf, kana, grade)
 
-        # Guard: avoid empty ruby (rare OOV edge)
-        if not core_read:
-            out.append(surf)
-        else:
-            ruby = f"<ruby>{core_surf}<rt>{core_read}</rt></ruby>{okurigana}"
-            out.append(ruby)
-    return "".join(out)
+def sanitize_and_ruby(text: str, grade: int) -> str:
+    """
+    inject_ruby(sanitize(text, grade), grade) in a single MeCab pass:
+    tokens with kanji above `grade` become hiragana, tokens with kanji
+    of exactly `grade` get ruby, everything else is kept as is.
+    """
+    return "".join(_sanitize_ruby_token(tok.surface, _kana_field(tok), grade)
+                   for tok in tagger(text))
 
 def validate_story(txt:str, grade:int, kanji:list[str], min_freq:int):
-    counts = {k:0 for k in kanji}
-    for ch in txt:
-        g = grade_of(ch)
-        if g and g > grade:
+    counts  = Counter(txt)                # one C-level pass over the text
+    allowed = allowed_kanji(grade)
+    # Counter keeps first-seen order → same "first offender" as a char scan
+    for ch in counts:
+        if ch not in allowed and is_kanji(ch):
             raise ValueError(f"Disallowed kanji {ch}")
-        if ch in counts:
-            counts[ch]+=1
-    for k,c in counts.items():
-        if c < min_freq:
-            raise ValueError(f"{k} appears {c} < required {min_freq}")
+    for k in kanji:
+        if counts[k] < min_freq:
+            raise ValueError(f"{k} appears {counts[k]} < required {min_freq}")
+
+_HALVED: dict[bytes, bytes] = {}   # blake2b digest → halved JPEG (repeated pictures)
+_HALVED_LOCK = threading.Lock()    # load_and_halve calls halve_image from threads
 
 def halve_image(img_bytes: bytes) -> bytes:
     """
-    Return a new JPEG at half the width/height of the original.
+    Return a JPEG at half the width/height of the original.
     Keeps EXIF orientation; quality=85 is a good compromise.
+    JPEGs under HALVE_MIN_SIDE are returned unchanged; other formats are
+    always re-encoded, since callers label the result image/jpeg.
     """
+    key = hashlib.blake2b(img_bytes, digest_size=16).digest()
+    if (hit := _HALVED.get(key)) is not None:
+        return hit
     with Image.open(io.BytesIO(img_bytes)) as im:
         w, h = im.size
-        im = im.resize((w // 2, h // 2), Image.LANCZOS)
+        if max(w, h) < HALVE_MIN_SIDE and im.format == "JPEG":  # EPUB and PDF share it
+            return img_bytes
+        size = (w // 2, h // 2)
+        # JPEG: let libjpeg(-turbo) decode straight at 1/2 scale in the DCT
+        # domain; no-op for other formats
+        im.draft(None, size)
+        if im.size != size:             # odd dims / non-JPEG → finish here
+            im = im.resize(size, Image.Resampling.LANCZOS)
         buf = io.BytesIO()
-        im.save(buf, format="JPEG", quality=85, dpi=(72, 72), optimize=True)
-        return buf.getvalue()
+        # optimize=True is an extra encoder pass for a few % on a thumbnail
+        im.save(buf, format="JPEG", quality=85, dpi=(72, 72))
+        small = buf.getvalue()
+    with _HALVED_LOCK:
+        if len(_HALVED) >= 16:
+            _HALVED.pop(next(iter(_HALVED)), None)
+        _HALVED[key] = small
+    return small
 
 async def load_images(n:int)->list[bytes]:
-    data=[]
-    for i in range(1,n+1):
-        path = BASE / IMG_PATTERN.format(index=i)
-        if not path.exists():
-            raise FileNotFoundError(path)
-        data.append(path.read_bytes())
-    return data
+    names = [IMG_PATTERN.format(index=i) for i in range(1, n+1)]
+    present = set(os.listdir(BASE))           # one directory read, not n stats
+    for name in names:
+        if name not in present:
+            raise FileNotFoundError(BASE / name)
+    # blocking reads go to threads so they overlap and the loop stays free
+    return list(await asyncio.gather(*[
+        asyncio.to_thread((BASE / name).read_bytes) for name in names]))
+
+async def load_and_halve(n:int)->tuple[list[bytes], list[bytes]]:
+    "load_images + every halve_image, the resizes in parallel threads."
+    imgs = await load_images(n)
+    smalls = await asyncio.gather(*[asyncio.to_thread(halve_image, b)
+                                    for b in imgs])
+    return imgs, list(smalls)
 
 # ---------- main test-driver ----------
 async def make_reader_local(
@@ -313,7 +452,7 @@ async def make_reader_local(
     title:str="LOCAL TEST EPUB"
 ):
     # Step I : load story.txt
-    data = json.loads(STORY_FILE.read_text(encoding="utf-8"))
+    data = orjson.loads(STORY_FILE.read_bytes())
     title       = data["title"].strip()
     story_raw   = data["story"].split("###END###")[0].strip()
     story_clean = sanitize(story_raw, grade)
@@ -323,121 +462,132 @@ async def make_reader_local(
     pdf_file  = f"{slug}.pdf"
 
     # Step II : load split.json
-    pieces_obj = json.load(open(SPLIT_FILE, encoding="utf-8"))
+    pieces_obj = orjson.loads(SPLIT_FILE.read_bytes())
     pieces = pieces_obj["pieces"]               # [{text:, prompt:}, …]
 
-    # Step III : load images
-    imgs = [None] if len(pieces) == 1 else await load_images(len(pieces))
-
-    # Step IV : ruby injection
-    html_pieces = [inject_ruby(sanitize(p["text"], grade), grade) for p in pieces]
-
-    # Step V : build EPUB (vertical-rl)
-    book = epub.EpubBook()
-    book.direction = 'rtl'       
-    book.set_identifier("kanji_reader_" + slug)
-    book.set_title(title)
-    book.add_author("Offline AI")
-
-    css = epub.EpubItem(
-        uid="style", file_name="style.css", media_type="text/css",
-        content="""body{writing-mode:vertical-rl;font-family:"Noto Serif JP";}
+    # Step III : start image reads/halving and the browser launch;
+    # they run while Step IV keeps the CPU busy
+    imgs_task = (asyncio.create_task(load_and_halve(len(pieces)))
+                 if len(pieces) > 1 else None)
+    browser_task = asyncio.create_task(_get_browser())
+
+    try:
+        # Step IV : ruby injection. A few ms per piece, so one worker thread:
+        # the loop stays free for Step III's tasks, and the per-token caches
+        # stay warm (worker processes cost more to start than the work itself)
+        html_pieces = await asyncio.to_thread(
+            lambda: [sanitize_and_ruby(p["text"], grade) for p in pieces])
+        imgs, smalls = ([None], [None]) if imgs_task is None else await imgs_task
+
+        # Step V : build EPUB (vertical-rl)
+        book = epub.EpubBook()
+        book.direction = 'rtl'       
+        book.set_identifier("kanji_reader_" + slug)
+        book.set_title(title)
+        book.add_author("Offline AI")
+
+        css = epub.EpubItem(
+            uid="style", file_name="style.css", media_type="text/css",
+            content="""body{writing-mode:vertical-rl;font-family:"Noto Serif JP";}
 img{max-width:100%;}div.pagebreak{page-break-after:always;}"""
-    )
-    book.add_item(css)
-
-    spine = []
-    pdf_pages = []  
-    for i, (html, img_bytes) in enumerate(zip(html_pieces, imgs), 1):
-        # 1️ always add the picture to manifest
-        if img_bytes is not None:
-            img_uid  = f"img{i}"
-            img_name = f"{img_uid}.jpg"
-            img_item = epub.EpubItem(
-                uid=img_uid, file_name=img_name,
-                media_type="image/jpeg", content=img_bytes
-            )
-            book.add_item(img_item)
-
-            epub_src = img_name
-            sm_bytes   = halve_image(img_bytes) 
-            data_uri = as_data_uri(sm_bytes)
-        else:
-            img_name = epub_src = data_uri = None
-        
-        # 2️ Decide layout
-        short = plain_len(html) < CHAR_THRESHOLD
-        pages_html = []
-
-        if short and img_bytes is not None:
-            # side-by-side single page
-            sec = f"""
-                <section class="side">
-                <div class="text">{html}</div>
-                <img src="{data_uri}" alt="">
-                </section>"""
-            epub_sec = sec.replace(data_uri, epub_src)
-            # one XHTML file
-            page = epub.EpubHtml(title=f"p{i}", file_name=f"p{i}.xhtml", lang="ja")
-            page.content = epub_sec
-            page.add_item(css)
-            book.add_item(page)
-            spine.append(page)
-            pdf_pages.append(sec)
-        else:
-            # text-only (solo) page
-            txt_sec  = f"<section class='solo'>{html}</section>"
-            txt_page = epub.EpubHtml(title=f"p{i}_txt", file_name=f"p{i}_txt.xhtml", lang="ja")
-            txt_page.content = txt_sec
-            txt_page.add_item(css)
-            book.add_item(txt_page)
-            spine.append(txt_page)
-            pdf_pages.append(txt_sec)
-
-            # optional picture page
+        )
+        book.add_item(css)
+
+        spine = []
+        pdf_pages = []  
+        for i, (html, img_bytes, sm_bytes) in enumerate(
+                zip(html_pieces, imgs, smalls), 1):
+            # 1️ always add the picture to manifest
             if img_bytes is not None:
-                img_sec  = f"<section class='picture'><img src='{data_uri}' alt=''></section>"
-                img_page = epub.EpubHtml(title=f"p{i}_img", file_name=f"p{i}_img.xhtml", lang="ja")
-                img_page.content = img_sec.replace(data_uri, epub_src)   # EPUB src
-                img_page.add_item(css)
-                book.add_item(img_page)
-                spine.append(img_page)
-                pdf_pages.append(img_sec)
+                img_uid  = f"img{i}"
+                img_name = f"{img_uid}.jpg"
+                img_item = epub.EpubItem(
+                    uid=img_uid, file_name=img_name,
+                    media_type="image/jpeg", content=img_bytes
+                )
+                book.add_item(img_item)
+
+                epub_src = img_name
+                data_uri = as_data_uri(sm_bytes)
+            else:
+                img_name = epub_src = data_uri = None
         
-        pdf_pages.extend(pages_html)
-        # 3️ Emit each <section> as its own XHTML file & add to spine
-        for j, sec in enumerate(pages_html, 1):
-            file_name = f"p{i}_{j}.xhtml"
-            page = epub.EpubHtml(title=f"p{i}_{j}", file_name=file_name, lang="ja")
-            page.content = sec
-            page.add_item(css)
-            book.add_item(page)
-            spine.append(page)
-
-
-    book.spine = ["nav"] + spine
-    book.add_item(epub.EpubNcx()); book.add_item(epub.EpubNav())
-
-    out = BASE / OUTPUT_FOLDER / filename
-    epub.write_epub(out, book)
-    print("✅ EPUB written to", out)
+            # 2️ Decide layout
+            short = plain_len(html) < CHAR_THRESHOLD
+
+            if short and img_bytes is not None:
+                # side-by-side single page
+                sec = f"""
+                    <section class="side">
+                    <div class="text">{html}</div>
+                    <img src="{data_uri}" alt="">
+                    </section>"""
+                epub_sec = sec.replace(data_uri, epub_src)
+                # one XHTML file
+                page = epub.EpubHtml(title=f"p{i}", file_name=f"p{i}.xhtml", lang="ja")
+                page.content = epub_sec
+                page.add_item(css)
+                book.add_item(page)
+                spine.append(page)
+                pdf_pages.append(sec)
+            else:
+                # text-only (solo) page
+                txt_sec  = f"<section class='solo'>{html}</section>"
+                txt_page = epub.EpubHtml(title=f"p{i}_txt", file_name=f"p{i}_txt.xhtml", lang="ja")
+                txt_page.content = txt_sec
+                txt_page.add_item(css)
+                book.add_item(txt_page)
+                spine.append(txt_page)
+                pdf_pages.append(txt_sec)
+
+                # optional picture page
+                if img_bytes is not None:
+                    img_sec  = f"<section class='picture'><img src='{data_uri}' alt=''></section>"
+                    img_page = epub.EpubHtml(title=f"p{i}_img", file_name=f"p{i}_img.xhtml", lang="ja")
+                    img_page.content = img_sec.replace(data_uri, epub_src)   # EPUB src
+                    img_page.add_item(css)
+                    book.add_item(img_page)
+                    spine.append(img_page)
+                    pdf_pages.append(img_sec)
+
+        book.spine = ["nav"] + spine
+        book.add_item(epub.EpubNcx()); book.add_item(epub.EpubNav())
+
+        out = BASE / OUTPUT_FOLDER / filename
+        epub.write_epub(out, book)
+        print("✅ EPUB written to", out)
     
-    # ─ Step VI : PDF ─
-    #full_html = build_full_html(html_pieces)
-    full_html = build_full_html(pdf_pages)
-    html_file = f"{slug}.html"
-    with open(BASE / OUTPUT_FOLDER / html_file, "w", encoding="utf-8") as fp:
-        fp.write(full_html)    
-    await html_to_pdf(full_html, BASE / OUTPUT_FOLDER / pdf_file)
+        # ─ Step VI : PDF ─
+        #full_html = build_full_html(html_pieces)
+        full_html = build_full_html(pdf_pages)
+        html_file = f"{slug}.html"
+        with open(BASE / OUTPUT_FOLDER / html_file, "w", encoding="utf-8") as fp:
+            fp.write(full_html)    
+        await browser_task
+        await html_to_pdf(full_html, BASE / OUTPUT_FOLDER / pdf_file)
+    finally:
+        # on failure nothing may be left pending: a running launch would leak
+        # Chromium past shutdown_pdf, a failed read would log "never retrieved"
+        if imgs_task is not None:
+            imgs_task.cancel()
+        await asyncio.gather(*[t for t in (imgs_task, browser_task) if t is not None],
+                             return_exceptions=True)
 
     return out
 
 # ---------- quick manual test ----------
 if __name__ == "__main__":
     import asyncio
-    asyncio.run(make_reader_local(
-        grade=3,
-        kanji=["泳","速","深"],
-        min_freq=5,
-        title="sample_local_reader"
-    ))
+
+    async def _main():
+        try:
+            await make_reader_local(
+                grade=3,
+                kanji=["泳","速","深"],
+                min_freq=5,
+                title="sample_local_reader"
+            )
+        finally:
+            await shutdown_pdf()
+
+    asyncio.run(_main())
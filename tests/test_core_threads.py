@@ -0,0 +1,26 @@
+"""
+sanitize() runs in several generate-job threads at once (main.py _POOL).
+fugashi tokens read their features from the tagger's lattice, so a shared
+tagger lets one thread's parse corrupt another's readings.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("fugashi")
+pytest.importorskip("unidic_lite")
+core = pytest.importorskip("reader.core")
+
+STORIES = [
+    "かのじょは美しい花を咲かせる庭を持っていました。",
+    "森の奥で小さな鳥が歌い、川は静かに流れていた。",
+    "昨日、友達と図書館へ行って、難しい本を読みました。",
+    "祖母は毎朝早く起きて、畑の野菜に水をやります。",
+]
+
+def test_sanitize_is_thread_safe():
+    expected = [core.sanitize(s, 1) for s in STORIES]
+    jobs = STORIES * 200
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        got = list(ex.map(lambda s: core.sanitize(s, 1), jobs))
+    assert got == expected * 200